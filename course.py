@@ -1,4 +1,7 @@
-import os, re, json, pickle, time, requests, ddddocr
+import os, re, io, sys, json, gzip, queue, pickle, time, logging, requests, ddddocr
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from contextlib import redirect_stdout
+from datetime import datetime
 from requests.adapters import HTTPAdapter
 from pathlib import Path
 from urllib.parse import urlparse, parse_qs
@@ -6,13 +9,26 @@ from bs4 import BeautifulSoup
 from configparser import ConfigParser
 from io import BytesIO
 from lxml import html as lxml_html
+from course_cache import (
+    load_course_cache,
+    save_course_cache,
+    cached_course,
+    update_course_cache,
+)
 
 BASE = "https://course.fcu.edu.tw"
 COOKIE_FILE = Path("cookies.pkl")
 SESSION_META = Path("session.json")
 
 ENABLE_FILE_DUMP = False  # 是否啟用網頁內容落檔功能
+LOG_DIR = Path("logs")
+LOG_FILE = LOG_DIR / "run.log"
+LOG_MAX_BYTES = 1024 * 1024  # 單一日誌檔上限，超過即輪替
+LOG_BACKUP_COUNT = 5  # 保留的壓縮舊檔數量
+DUMP_DIR = LOG_DIR / "dumps"
+DUMP_MAX_FILES = 20  # 頁面落檔數量上限，超過即刪除最舊的
 RE_SPACE = re.compile(r"\s+")
+RE_QUOTA = re.compile(r"剩餘名額/開放名額：(\d+)\s*/\d+")
 
 X_COURSE_NAME = "string(//table[@id='ctl00_MainContent_TabContainer1_tabSelected_gvToAdd']//td[contains(@class,'gvAddWithdrawCellThree')][1])"
 X_MSG = "string(//span[@id='ctl00_MainContent_TabContainer1_tabSelected_lblMsgBlock'])"
@@ -40,6 +56,127 @@ def text_xpath(page_text: str, xpath: str, default="") -> str:
         return default
 
 
+RUN_LOG = logging.getLogger("fcu_class")
+
+
+def _gzip_rotator(source: str, dest: str):
+    """輪替時將舊日誌壓縮成 .gz 並移除原檔"""
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        f_out.writelines(f_in)
+    os.remove(source)
+
+
+class PageDumpHandler(logging.Handler):
+    """將帶有 page 屬性的紀錄寫成獨立的 .html.gz，並只保留最新 DUMP_MAX_FILES 份"""
+
+    def __init__(self, directory: Path = DUMP_DIR, max_files: int = DUMP_MAX_FILES):
+        super().__init__()
+        self.directory = directory
+        self.max_files = max_files
+
+    def emit(self, record):
+        page = getattr(record, "page", None)
+        if page is None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            stamp = datetime.fromtimestamp(record.created).strftime("%Y%m%d_%H%M%S_%f")
+            tag = re.sub(r"[^\w.-]+", "_", getattr(record, "dump_tag", "page"))
+            target = self.directory / f"{stamp}_{tag}.html.gz"
+            with gzip.open(target, "wt", encoding="utf-8") as f:
+                f.write(page)
+            dumps = sorted(self.directory.glob("*.html.gz"))
+            for old in dumps[: max(0, len(dumps) - self.max_files)]:
+                old.unlink()
+        except Exception:
+            self.handleError(record)
+
+
+class LogTee(io.TextIOBase):
+    """把 print() 同時寫到原本的輸出與 RUN_LOG（只是排入佇列，不碰磁碟）"""
+
+    def __init__(self, stream, logger: logging.Logger = RUN_LOG):
+        super().__init__()
+        self.stream = stream
+        self.logger = logger
+        self._buf = ""
+
+    def write(self, s):
+        self.stream.write(s)
+        self._buf += s
+        while "\n" in self._buf:
+            line, self._buf = self._buf.split("\n", 1)
+            if line.strip():
+                self.logger.info(line)
+        return len(s)
+
+    def flush(self):
+        if self._buf.strip():
+            self.logger.info(self._buf)
+        self._buf = ""
+        self.stream.flush()
+
+
+def start_run_log() -> QueueListener | None:
+    """
+    建立非同步日誌：選課執行緒只把紀錄丟進佇列，
+    由 QueueListener 的背景執行緒負責寫檔、輪替與壓縮。
+    """
+    for h in list(RUN_LOG.handlers):  # GUI 每次執行都會重新匯入 course.py
+        RUN_LOG.removeHandler(h)
+    RUN_LOG.setLevel(logging.INFO)
+    RUN_LOG.propagate = False
+    try:
+        LOG_DIR.mkdir(parents=True, exist_ok=True)
+        file_handler = RotatingFileHandler(
+            LOG_FILE,
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
+            encoding="utf-8",
+        )
+    except OSError as e:
+        RUN_LOG.addHandler(logging.NullHandler())
+        print(f"⚠️ 無法建立日誌檔，僅顯示於畫面：{e}")
+        return None
+    file_handler.namer = lambda name: name + ".gz"
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(
+        logging.Formatter("%(asctime)s %(levelname)s %(message)s")
+    )
+    handlers = [file_handler]
+    if ENABLE_FILE_DUMP:
+        handlers.append(PageDumpHandler())
+
+    q = queue.SimpleQueue()
+    RUN_LOG.addHandler(QueueHandler(q))
+    listener = QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def stop_run_log(listener: QueueListener | None):
+    """送出佇列中剩餘的紀錄並關閉檔案"""
+    for h in list(RUN_LOG.handlers):
+        RUN_LOG.removeHandler(h)
+    # 避免之後的紀錄落到 logging.lastResort 而印到 stderr
+    RUN_LOG.addHandler(logging.NullHandler())
+    if listener is None:
+        return
+    listener.stop()
+    for h in listener.handlers:
+        h.close()
+
+
+def dump_page(tag: str, page_text: str, reason: str = ""):
+    """ENABLE_FILE_DUMP 開啟時，將異常頁面原始內容交給背景執行緒落檔"""
+    if not ENABLE_FILE_DUMP:
+        return
+    RUN_LOG.warning(
+        f"頁面落檔 [{tag}] {reason}".rstrip(),
+        extra={"page": page_text, "dump_tag": tag},
+    )
+
+
 def _parse_tb_ids(raw: str) -> list[str]:
     """支援逗號/空白/換行或 JSON 陣列，回傳去重後的有序清單"""
     raw = (raw or "").strip()
@@ -263,6 +400,7 @@ def get_hidden_fields_fast(page_text):
     vg = tree.xpath('//input[@name="__VIEWSTATEGENERATOR"]/@value')
     ev = tree.xpath('//input[@name="__EVENTVALIDATION"]/@value')
     if not (vs and vg and ev):
+        dump_page("hidden_fields", page_text, "頁面缺少必要隱藏欄位")
         raise RuntimeError("頁面缺少必要隱藏欄位")
     return vs[0], vg[0], ev[0]
 
@@ -286,7 +424,7 @@ def parse_quota_info(quota_info: str) -> int:
     回傳 X，如果解析失敗回傳 0
     """
     try:
-        match = re.search(r"剩餘名額/開放名額：(\d+)\s*/\d+", quota_info)
+        match = RE_QUOTA.search(quota_info)
         if match:
             return int(match.group(1))
         return 0
@@ -294,13 +432,8 @@ def parse_quota_info(quota_info: str) -> int:
         return 0
 
 
-def query_course_quota(session, add_withdraw_url, sub_id, vs, vg, ev):
-    """
-    單獨函數：查詢課程並查詢其餘額。
-    回傳 (courseName, quota_info, quota_msg, new_vs, new_vg, new_ev, quota_html)
-    如果失敗，quota_info 為 "未知"
-    """
-    # 🔍 查詢該科
+def query_course(session, add_withdraw_url, sub_id, vs, vg, ev) -> str:
+    """送出「查詢」該科，回傳查詢結果頁面；會話失效時丟出 RuntimeError"""
     query_data = {
         "ctl00_ToolkitScriptManager1_HiddenField": "",
         "ctl00_MainContent_TabContainer1_ClientState": '{"ActiveTabIndex":1,"TabState":[true,true]}',
@@ -316,13 +449,27 @@ def query_course_quota(session, add_withdraw_url, sub_id, vs, vg, ev):
         "ctl00$MainContent$TabContainer1$tabSelected$cpeWishList_ClientState": "false",
     }
     r = session.post(add_withdraw_url, data=query_data)
-    courseName = text_xpath(r.text, X_COURSE_NAME)
-
     if is_session_timeout(r.text) or is_login_page(r.text):
         raise RuntimeError("會話失效，需要重新登入")
+    return r.text
+
+
+def query_course_quota(
+    session, add_withdraw_url, sub_id, vs, vg, ev, courseName: str | None = None
+):
+    """
+    單獨函數：查詢課程並查詢其餘額。
+    回傳 (courseName, quota_info, quota_msg, new_vs, new_vg, new_ev, quota_html)
+    如果失敗，quota_info 為 "未知"
+    courseName 已由快取提供時，略過課名解析
+    """
+    # 🔍 查詢該科
+    page = query_course(session, add_withdraw_url, sub_id, vs, vg, ev)
+    if courseName is None:
+        courseName = text_xpath(page, X_COURSE_NAME)
 
     # 更新隱藏欄位
-    vs, vg, ev = get_hidden_fields_fast(r.text)
+    vs, vg, ev = get_hidden_fields_fast(page)
 
     # 查詢餘額（假設查詢後該課程為第一個選項，使用 selquota$0）
     quota_data = {
@@ -352,7 +499,58 @@ def query_course_quota(session, add_withdraw_url, sub_id, vs, vg, ev):
     return courseName, quota_info, quota_msg, new_vs, new_vg, new_ev, quota_r.text
 
 
+def validate_course_ids(session, add_withdraw_url, tb_ids, cache):
+    """
+    執行前先查詢快取中沒有或已過期的課程代號，填入課名與加選列數。
+    查不到課名的代號只會醒目提示（可能是輸入錯誤，也可能是尚未開放或忙碌頁），
+    不會從清單中移除，仍照常參與每一輪選課。
+    """
+    pending = [sid for sid in tb_ids if cached_course(cache, sid) is None]
+    if not pending:
+        return
+
+    r = session.get(add_withdraw_url, allow_redirects=True)
+    if is_session_timeout(r.text) or is_login_page(r.text):
+        raise RuntimeError("會話失效，需要重新登入")
+    vs, vg, ev = get_hidden_fields_fast(r.text)
+
+    changed = False
+    for sub_id in pending:
+        page = query_course(session, add_withdraw_url, sub_id, vs, vg, ev)
+        vs, vg, ev = get_hidden_fields_fast(page)
+        name = text_xpath(page, X_COURSE_NAME)
+        if not name:
+            msg = text_xpath(page, X_MSG) or "無訊息"
+            print(
+                f'❗❗ 課程代號 {sub_id} 查不到課名 "{msg}"，'
+                "請確認是否輸入錯誤（仍會繼續嘗試此代號）"
+            )
+            continue
+        changed |= update_course_cache(
+            cache, sub_id, name, len(find_add_event_args(page))
+        )
+        print(f"ℹ️ 課程代號 {sub_id}：{name}")
+
+    if changed:
+        save_course_cache(cache)
+
+
 def main(stop_check_func=None):
+    listener = start_run_log()
+    course_cache = load_course_cache()
+    try:
+        with redirect_stdout(LogTee(sys.stdout)):
+            _run(stop_check_func, course_cache)
+    except Exception:
+        RUN_LOG.exception("執行中止")
+        raise
+    finally:
+        if course_cache:
+            save_course_cache(course_cache)  # 選課迴圈內只更新記憶體，結束時才寫回
+        stop_run_log(listener)
+
+
+def _run(stop_check_func=None, course_cache=None):
     config_result = load_config()
     NID, PASS, TB_SUB_IDS, RETRY_ENABLED, RETRY_COUNT, RETRY_INTERVAL = config_result
     session = make_session()
@@ -375,6 +573,13 @@ def main(stop_check_func=None):
 
     add_withdraw_url = f"{base}/AddWithdraw.aspx?guid={guid}&lang={lang}"
 
+    if course_cache is None:
+        course_cache = {}
+    try:
+        validate_course_ids(session, add_withdraw_url, TB_SUB_IDS, course_cache)
+    except (RuntimeError, requests.RequestException) as e:
+        print(f"⚠️ 課程代號預先檢查失敗，略過檢查：{e}")
+
     # 如果啟用重試，則進行多輪重試
     if RETRY_ENABLED:
         if RETRY_COUNT == 0:
@@ -397,7 +602,7 @@ def main(stop_check_func=None):
                 print(f"\n===== 第 {retry_round} 輪重試 =====")
 
             all_success, need_relogin = process_course_selection(
-                session, add_withdraw_url, TB_SUB_IDS, stop_check_func
+                session, add_withdraw_url, TB_SUB_IDS, stop_check_func, course_cache
             )
             if need_relogin:
                 print("🔄 偵測到『系統偵測異常』，執行重新登入...")
@@ -444,7 +649,7 @@ def main(stop_check_func=None):
                 time.sleep(0.1)  # 100ms 的最小延遲
     else:
         all_success, need_relogin = process_course_selection(
-            session, add_withdraw_url, TB_SUB_IDS, stop_check_func
+            session, add_withdraw_url, TB_SUB_IDS, stop_check_func, course_cache
         )
         if need_relogin:
             print("🔄 偵測到『系統偵測異常』，重新登入後再嘗試一次...")
@@ -453,7 +658,7 @@ def main(stop_check_func=None):
                 guid, lang, base = do_login(session, NID, PASS)
                 add_withdraw_url = f"{base}/AddWithdraw.aspx?guid={guid}&lang={lang}"
                 process_course_selection(
-                    session, add_withdraw_url, TB_SUB_IDS, stop_check_func
+                    session, add_withdraw_url, TB_SUB_IDS, stop_check_func, course_cache
                 )
             except Exception as e:
                 print(f"❌ 重新登入失敗：{e}")
@@ -462,12 +667,15 @@ def main(stop_check_func=None):
 
 
 def process_course_selection(
-    session, add_withdraw_url, TB_SUB_IDS, stop_check_func=None
+    session, add_withdraw_url, TB_SUB_IDS, stop_check_func=None, course_cache=None
 ):
     """處理課程選課
     回傳 (all_success, need_relogin)
     need_relogin: 是否因『系統偵測異常』需要重新登入
+    course_cache: 課程快取，命中時略過課名解析；這裡只更新記憶體，不寫檔
     """
+    if course_cache is None:
+        course_cache = {}
     all_success = True
     need_relogin = False
 
@@ -488,9 +696,18 @@ def process_course_selection(
         success = False
         while not success:
             try:
-                # 查詢課程並查詢餘額
+                # 查詢課程並查詢餘額（快取命中時沿用課名）
+                cached = cached_course(course_cache, sub_id)
                 courseName, quota_info, quota_msg, vs, vg, ev, quota_html = (
-                    query_course_quota(session, add_withdraw_url, sub_id, vs, vg, ev)
+                    query_course_quota(
+                        session,
+                        add_withdraw_url,
+                        sub_id,
+                        vs,
+                        vg,
+                        ev,
+                        cached["name"] if cached else None,
+                    )
                 )
                 # print(
                 #     f'ℹ️ 第 {idx} 科: {sub_id} {courseName} 餘額查詢: "{quota_info}" (訊息: {quota_msg})'
@@ -498,6 +715,14 @@ def process_course_selection(
 
                 # 檢查是否有空位
                 remaining = parse_quota_info(quota_info)
+                event_args = find_add_event_args(quota_html)
+                update_course_cache(
+                    course_cache,
+                    sub_id,
+                    None if cached else courseName,
+                    len(event_args),
+                    remaining if RE_QUOTA.search(quota_info) else None,
+                )
                 if remaining <= 0:
                     print(
                         f"❌ 第 {idx} 科: {sub_id} {courseName} 無空位 ({quota_info})"
@@ -505,12 +730,11 @@ def process_course_selection(
                     all_success = False
                     break  # 無空位，跳到下一科或結束
 
-                # 找出所有可加選列（使用查詢餘額後的頁面）
-                event_args = find_add_event_args(quota_html)
                 last_msg = "無加選按鈕"
                 if not event_args:
                     msg_txt = text_xpath(quota_html, X_MSG)
                     last_msg = msg_txt or last_msg
+                    dump_page(f"noadd_{sub_id}", quota_html, last_msg)
                     print(f'❌ 第 {idx} 科: {sub_id} {courseName} "{last_msg}"')
                     all_success = False
                     break
@@ -546,6 +770,7 @@ def process_course_selection(
                         except Exception as e:
                             print(f"刪除 cookies 失敗: {e}")
                         print(f'❌ 第 {idx} 科: {sub_id} {courseName} "{last_msg}"')
+                        dump_page(f"anomaly_{sub_id}", r.text, last_msg)
                         return False, True
 
                     if any(k in text_msg for k in ("成功", "已加選", "完成")):
@@ -553,6 +778,9 @@ def process_course_selection(
                         print(f'✅ 第 {idx} 科: {sub_id} {courseName} "{last_msg}"')
                         break
 
+                    if not text_msg:  # 沒有任何訊息的回應才是非預期頁面
+                        dump_page(f"add_{sub_id}", r.text, "加選後無訊息")
+
                     # 更新隱藏欄位以便嘗試下一列
                     try:
                         vs, vg, ev = get_hidden_fields_fast(r.text)
@@ -0,0 +1,83 @@
+import os, json, time
+from pathlib import Path
+
+COURSE_CACHE = Path("course_cache.json")
+COURSE_CACHE_TTL = 24 * 60 * 60  # 課程快取有效秒數，過期後重新查詢課名
+COURSE_QUOTA_TTL = 10 * 60  # 最近一次餘額的有效秒數，過期即不再顯示
+
+
+def load_course_cache() -> dict:
+    """讀取課程快取：{sub_id: {"name", "rows", "quota", "ts"}}，以 sub_id 為鍵 O(1) 查詢
+    格式不符的項目直接忽略，視同未快取
+    """
+    if not COURSE_CACHE.exists():
+        return {}
+    try:
+        data = json.loads(COURSE_CACHE.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {k: v for k, v in data.items() if isinstance(v, dict)}
+
+
+def save_course_cache(cache: dict):
+    """先寫入暫存檔再 os.replace，避免中途中斷或同時讀取時拿到不完整的檔案"""
+    tmp = COURSE_CACHE.with_name(COURSE_CACHE.name + ".tmp")
+    try:
+        tmp.write_text(
+            json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8"
+        )
+        os.replace(tmp, COURSE_CACHE)
+    except OSError as e:
+        print(f"⚠️ 課程快取寫入失敗：{e}")
+
+
+def cached_course(cache: dict, sub_id: str) -> dict | None:
+    """回傳未過期的快取項目，過期、不存在或格式錯誤則回傳 None"""
+    entry = cache.get(sub_id)
+    if not isinstance(entry, dict) or not entry.get("name"):
+        return None
+    try:
+        age = time.time() - float(entry.get("ts", 0))
+    except (TypeError, ValueError):
+        return None
+    if age > COURSE_CACHE_TTL:
+        return None
+    return entry
+
+
+def cached_quota(entry) -> tuple[int, float] | None:
+    """回傳 (餘額, 距今秒數)；沒有紀錄、格式錯誤或超過 COURSE_QUOTA_TTL 則回傳 None"""
+    if not isinstance(entry, dict) or "quota" not in entry:
+        return None
+    try:
+        quota = int(entry["quota"])
+        age = time.time() - float(entry.get("quota_ts", 0))
+    except (TypeError, ValueError):
+        return None
+    if age < 0 or age > COURSE_QUOTA_TTL:
+        return None
+    return quota, age
+
+
+def update_course_cache(
+    cache: dict, sub_id: str, name, rows: int, quota=None
+) -> bool:
+    """name 為新解析的課名時才更新 ts（重新計算 TTL）；quota 另記 quota_ts
+    回傳課名或加選列數是否有變動
+    """
+    entry = cache.get(sub_id)
+    if not isinstance(entry, dict):
+        entry = cache[sub_id] = {}
+    changed = entry.get("rows") != rows
+    now = time.time()
+    if name:
+        changed = changed or entry.get("name") != name
+        entry["name"] = name
+        entry["ts"] = now
+    entry["rows"] = rows
+    if quota is not None:
+        entry["quota"] = quota
+        entry["quota_ts"] = now
+    return changed
@@ -1,4 +1,4 @@
-import sys, io, os, threading, configparser, traceback, pathlib
+import sys, io, os, re, threading, configparser, traceback, pathlib
 from pathlib import Path
 from contextlib import redirect_stdout, redirect_stderr
 import importlib.util
@@ -17,6 +17,7 @@ from PySide6.QtWidgets import (
     QCheckBox,
     QSpinBox,
 )
+from course_cache import load_course_cache, cached_quota
 
 
 def import_run_main():
@@ -48,6 +49,7 @@ COOKIE_PATTERNS = [
 
 class LogEmitter(QObject):
     text = Signal(str)
+    finished = Signal()
 
 
 class QtStream(io.TextIOBase):
@@ -76,10 +78,11 @@ class QtStream(io.TextIOBase):
 class Runner:
     """在背景執行 course.main()"""
 
-    def __init__(self, append_log):
+    def __init__(self, append_log, on_finished=None):
         self._thread = None
         self._stop_flag = False
         self.append_log = append_log
+        self.on_finished = on_finished
 
     def start(self):
         if self._thread and self._thread.is_alive():
@@ -108,6 +111,8 @@ class Runner:
             return
         emitter = LogEmitter()
         emitter.text.connect(self.append_log)
+        if self.on_finished:
+            emitter.finished.connect(self.on_finished)
         qstream_out = QtStream(emitter)
         qstream_err = QtStream(emitter)
         try:
@@ -118,6 +123,8 @@ class Runner:
             pass
         except Exception as e:
             self.append_log(f"[執行例外] {e}\n{traceback.format_exc()}\n")
+        finally:
+            emitter.finished.emit()
 
 
 class MainWin(QWidget):
@@ -138,6 +145,10 @@ class MainWin(QWidget):
         self.ed_tb = QTextEdit()
         self.ed_tb.setPlaceholderText("課程代號清單：可逗號、空白、換行或 JSON 陣列")
         self._set_two_line_height(self.ed_tb)  # 兩行高度
+        self.lb_names = QLabel()
+        self.lb_names.setWordWrap(True)
+        self._course_cache = {}
+        self.ed_tb.textChanged.connect(self._show_course_names)
 
         # 重試設定
         self.ck_retry = QCheckBox("啟用自動重試")
@@ -182,6 +193,7 @@ class MainWin(QWidget):
 
         top.addWidget(QLabel("課程代號(使用,逗號分隔)"))
         top.addWidget(self.ed_tb)
+        top.addWidget(self.lb_names)
 
         # 重試設定區域
         retry_layout = QVBoxLayout()
@@ -223,7 +235,7 @@ class MainWin(QWidget):
         self.btn_run.clicked.connect(self.run_job)
         self.btn_stop.clicked.connect(self.stop_job)
 
-        self.runner = Runner(self.append_log)
+        self.runner = Runner(self.append_log, self._refresh_course_names)
 
         if INI.exists():
             self.load_ini()
@@ -238,6 +250,26 @@ class MainWin(QWidget):
         padding = 16  # 邊距估計
         te.setFixedHeight(line_h * 2 + padding)
 
+    def _refresh_course_names(self):
+        """執行結束後重新讀取 course.py 寫入的快取並更新課名"""
+        self._course_cache = load_course_cache()
+        self._show_course_names()
+
+    def _show_course_names(self):
+        """依快取顯示課程名稱與未過期的最近餘額，尚未查詢過的代號標示為未快取"""
+        ids = re.findall(r"[^\s,\[\]\"']+", self.ed_tb.toPlainText())
+        parts = []
+        for sub_id in dict.fromkeys(ids):
+            entry = self._course_cache.get(sub_id)
+            if not isinstance(entry, dict):
+                entry = {}
+            text = f"{sub_id} {entry.get('name') or '（未快取）'}"
+            quota = cached_quota(entry)
+            if quota:
+                text += f"（餘額 {quota[0]}，{int(quota[1] // 60)} 分鐘前）"
+            parts.append(text)
+        self.lb_names.setText("、".join(parts))
+
     def append_log(self, s: str):
         cursor = self.log.textCursor()
         cursor.movePosition(QTextCursor.End)
@@ -269,6 +301,7 @@ class MainWin(QWidget):
 
             self.ed_nid.setText(nid)
             self.ed_pwd.setText(pwd)
+            self._course_cache = load_course_cache()
             self.ed_tb.setPlainText(tb)
             self.ck_retry.setChecked(retry_enabled)
             self.sp_retry_count.setValue(retry_count)